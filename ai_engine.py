@@ -1,6 +1,10 @@
+import io
 import os
 import json
 import random
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from google import genai
 from dotenv import load_dotenv
 
@@ -37,7 +41,7 @@ except ImportError:
 try:
     from docx import Document
     from pptx import Presentation
-    from pypdf import PdfReader
+    from pypdf import PdfReader, PdfWriter
 except ImportError:
     print("⚠️ Document libraries not found. Please run: pip install pypdf python-docx python-pptx")
 
@@ -72,21 +76,256 @@ def extract_digital_text(filepath):
         return ""
 
 
-# --- ENGINE 2: OPTICAL (Future Work / Placeholder) ---
+# --- ENGINE 2: OPTICAL (Per-page OCR) ---
+# Scanned pages are found page by page and only those go to the OCR backend, which runs
+# in a separate process pool. Results are cached on disk by page hash, so re-uploads and
+# documents shared between courses are never OCR'd twice.
+# No backend is configured by default: scanned pages then keep their digital text and
+# nothing is cached. OCR_BACKEND=stub enables the deterministic test stub.
+OCR_MIN_PAGE_CHARS = 40      # Pages with less selectable text than this are OCR candidates
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "2"))
+OCR_PAGE_TIMEOUT = 120       # Seconds to wait for a single page
+OCR_BACKEND = os.getenv("OCR_BACKEND", "")
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+
+ocr_pool = None
+
+
+def stub_ocr_backend(page_bytes):
+    """ Deterministic stand-in for tests: the same page always gives the same text """
+    digest = hashlib.sha256(page_bytes).hexdigest()[:12]
+    return f"[OCR] Simulated text for scanned page {digest}. (OCR marked as Future Work)"
+
+
+# name -> fn(page_bytes) -> text. Backends must be module-level functions so the
+# worker processes can import them (e.g. a future Huawei Cloud / MindSpore OCR client).
+OCR_BACKENDS = {"stub": stub_ocr_backend}
+
+
+def register_ocr_backend(name, backend):
+    OCR_BACKENDS[name] = backend
+
+
+def get_ocr_backend():
+    """ The configured backend, or None when OCR is not set up """
+    return OCR_BACKENDS.get(OCR_BACKEND)
+
+
+def get_ocr_pool():
+    global ocr_pool
+    if ocr_pool is None:
+        ocr_pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS)
+    return ocr_pool
+
+
+def ocr_cache_path(page_hash):
+    return os.path.join(OCR_CACHE_DIR, OCR_BACKEND, f"{page_hash}.txt")
+
+
+def read_ocr_cache(page_hash):
+    try:
+        with open(ocr_cache_path(page_hash), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_ocr_cache(page_hash, text):
+    path = ocr_cache_path(page_hash)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    except OSError as e:
+        print(f"⚠️ OCR Cache Error: {e}")
+
+
+def run_ocr_jobs(jobs):
+    """
+    jobs: {key: (page_hash, page_bytes)} -> {key: text}
+    Cached pages are answered from disk, the rest run in parallel in the worker pool.
+    A page that fails comes back as "" and is not cached, so a later upload retries it.
+    """
+    global ocr_pool
+    backend = get_ocr_backend()
+    results, pending = {}, {}
+    if backend is None:
+        return results
+
+    for key, (page_hash, page_bytes) in jobs.items():
+        cached = read_ocr_cache(page_hash)
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[key] = (page_hash, page_bytes)
+
+    if not pending:
+        return results
+
+    try:
+        pool = get_ocr_pool()
+        futures = {key: pool.submit(backend, page_bytes) for key, (_, page_bytes) in pending.items()}
+    except Exception as e:
+        # No worker processes available (e.g. restricted host): OCR in this process instead
+        print(f"⚠️ OCR Pool Error: {e}. Running OCR inline.")
+        futures = None
+
+    for key, (page_hash, page_bytes) in pending.items():
+        try:
+            if futures:
+                text = futures[key].result(timeout=OCR_PAGE_TIMEOUT)
+            else:
+                text = backend(page_bytes)
+            write_ocr_cache(page_hash, text)
+            results[key] = text
+        except BrokenProcessPool as e:
+            # A worker died: start a fresh pool next time
+            print(f"❌ OCR Error (page {key}): {e}")
+            ocr_pool = None
+            results[key] = ""
+        except Exception as e:
+            print(f"❌ OCR Error (page {key}): {e}")
+            results[key] = ""
+
+    return results
+
+
+def walk_xobjects(resources, seen=None, depth=0):
+    """ Yields (name, object) for every XObject reachable from `resources`, inside forms too """
+    if depth > 10:
+        raise ValueError("XObject nesting too deep")
+    seen = set() if seen is None else seen
+    resources = resources.get_object() if resources else None
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return
+
+    xobjects = xobjects.get_object()
+    for name in sorted(xobjects):
+        ref = xobjects[name]
+        idnum = getattr(ref, "idnum", None)
+        if idnum is not None and idnum in seen:
+            continue
+        if idnum is not None:
+            seen.add(idnum)
+
+        obj = ref.get_object()
+        yield name, obj
+        if obj.get("/Subtype") == "/Form":
+            yield from walk_xobjects(obj.get("/Resources"), seen, depth + 1)
+
+
+def page_image_xobjects(page):
+    """ Image XObjects the page draws, directly or wrapped in form XObjects """
+    return {name: obj for name, obj in walk_xobjects(page.get("/Resources"))
+            if obj.get("/Subtype") == "/Image"}
+
+
+def needs_ocr(page, text):
+    """ Image-only or low-text pages (scans, photographed slides) """
+    stripped = text.strip()
+    if len(stripped) >= OCR_MIN_PAGE_CHARS:
+        return False
+    if not stripped:
+        return True
+    try:
+        return bool(page_image_xobjects(page))
+    except Exception:
+        return True
+
+
+def page_to_pdf_bytes(page):
+    """ A single-page PDF, which is what the OCR backends receive """
+    writer = PdfWriter()
+    writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def hash_page(page, page_bytes):
+    """
+    Fingerprint of what the page draws: its content stream plus every XObject it can reach,
+    including images wrapped in form XObjects. Falls back to the single-page PDF bytes.
+    """
+    digest = hashlib.sha256()
+    try:
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        for name, obj in walk_xobjects(page.get("/Resources")):
+            digest.update(str(name).encode("utf-8"))
+            digest.update(str(obj.get("/Subtype")).encode("utf-8"))
+            digest.update(obj.get_data())
+    except Exception:
+        digest = hashlib.sha256(page_bytes)
+    return digest.hexdigest()
+
+
+def extract_pdf_text(filepath):
+    """ Per-page routing: selectable pages are read directly, scanned pages go to OCR """
+    try:
+        reader = PdfReader(filepath)
+        pages = list(reader.pages)
+    except Exception as e:
+        print(f"Digital Extraction Error: {e}")
+        return ""
+
+    # Without a backend, scanned pages simply keep whatever digital text they have
+    ocr_enabled = get_ocr_backend() is not None
+    texts, jobs = [], {}
+    for index, page in enumerate(pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        texts.append(text)
+
+        if ocr_enabled and needs_ocr(page, text):
+            try:
+                page_bytes = page_to_pdf_bytes(page)
+                jobs[index] = (hash_page(page, page_bytes), page_bytes)
+            except Exception as e:
+                print(f"⚠️ Could not prepare page {index + 1} for OCR: {e}")
+
+    if jobs:
+        print(f"🔎 {len(jobs)}/{len(pages)} pages in {filepath} need OCR.")
+        for index, ocr_text in run_ocr_jobs(jobs).items():
+            # Keep whatever little digital text the page had (titles, page numbers)
+            texts[index] = "\n".join(t for t in (texts[index].strip(), ocr_text) if t)
+
+    return "\n".join(texts)
+
+
 def extract_optical_text(filepath):
-    """ Placeholder for MindSpore OCR """
-    # In future, connect to Huawei Cloud OCR here for images/scans
-    return "[OCR] This is simulated text from an image/scan. (OCR marked as Future Work)"
+    """ Whole-file OCR for files without a readable page structure (images, unknown types) """
+    if get_ocr_backend() is None:
+        print(f"⚠️ No OCR backend configured (OCR_BACKEND). Skipping {filepath}.")
+        return ""
+
+    try:
+        with open(filepath, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"Optical Extraction Error: {e}")
+        return ""
+
+    return run_ocr_jobs({0: (hashlib.sha256(data).hexdigest(), data)}).get(0, "")
 
 
 # --- THE ROUTER (Connects main.py to the right engine) ---
 def extract_text_from_file(filepath):
     """ Decides whether to use Digital extraction or Optical extraction based on file type """
+    ext = os.path.splitext(filepath)[1].lower()
+
+    # 1. PDFs are routed page by page (digital pages + OCR for scanned ones)
+    if ext == '.pdf':
+        return extract_pdf_text(filepath)
 
-    # 1. Try Digital Extraction first (PDF, DOCX, PPTX)
+    # 2. Try Digital Extraction (DOCX, PPTX)
     text = extract_digital_text(filepath)
 
-    # 2. If text is empty (e.g. scanned PDF or Image), try Optical (Future Work)
+    # 3. If text is empty (e.g. Image), try Optical on the whole file
     if not text.strip():
         print(f"⚠️ No text found in {filepath}. Attempting Optical Extraction...")
         return extract_optical_text(filepath)
@@ -125,70 +364,309 @@ def find_best_context(user_query, full_text):
     return paragraphs[best_idx][:2500]
 
 
-def ask_bot(user_question, full_text_history=None):
+# --- CONVERSATION MEMORY ---
+# Every prompt gets at most MEMORY_TOKEN_BUDGET tokens of history: a rolling summary of
+# older turns (refreshed in the background by main.py) plus the last few turns verbatim.
+MEMORY_TOKEN_BUDGET = 1000
+MEMORY_SUMMARY_TOKENS = 300
+MEMORY_TURN_TOKENS = 150
+
+
+def estimate_tokens(text):
+    """ Rough token count (~4 characters per token). Good enough for budgeting prompts. """
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + " ..."
+
+
+def build_memory_context(summary, recent_turns):
+    """
+    Packs the rolling summary and the recent turns into one block that never exceeds
+    MEMORY_TOKEN_BUDGET. recent_turns is a list of (is_user, text), oldest first.
+    Older turns are dropped first when the budget runs out.
+    """
+    summary = truncate_to_tokens(summary.strip(), MEMORY_SUMMARY_TOKENS) if summary else ""
+    budget = MEMORY_TOKEN_BUDGET - estimate_tokens(summary)
+
+    lines = []
+    for is_user, text in reversed(recent_turns):
+        speaker = "Student" if is_user else "Tutor"
+        line = f"{speaker}: {truncate_to_tokens(text.strip(), MEMORY_TURN_TOKENS)}"
+        budget -= estimate_tokens(line)
+        if budget < 0:
+            break
+        lines.append(line)
+    lines.reverse()
+
+    parts = []
+    if summary:
+        parts.append(f"Summary of earlier conversation:\n{summary}")
+    if lines:
+        parts.append("Most recent turns:\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def rewrite_query(user_question, memory_context):
+    """
+    Turns a follow-up ("explain that again with an example") into a standalone query
+    for retrieval. Falls back to the original question if anything goes wrong.
+    """
+    if not client or not memory_context:
+        return user_question
+
+    prompt = (
+        "Rewrite the student's latest question so it can be understood without the conversation. "
+        "Resolve pronouns and references like 'that' or 'it' using the conversation. "
+        "If it is already standalone, return it unchanged. Return ONLY the rewritten question.\n\n"
+        f"--- CONVERSATION ---\n{memory_context}\n--- END ---\n\n"
+        f"LATEST QUESTION: {user_question}"
+    )
+
+    try:
+        response = client.models.generate_content(
+            model='gemini-2.5-flash',
+            contents=prompt
+        )
+        rewritten = (response.text or "").strip()
+        return rewritten or user_question
+    except Exception as e:
+        print(f"⚠️ Query Rewrite Error: {e}")
+        return user_question
+
+
+def update_rolling_summary(previous_summary, turns):
+    """
+    Folds older turns into the running summary. Returns None on failure so the caller
+    can keep the old summary and retry later.
+    """
+    if not client: return None
+
+    transcript = "\n".join(
+        f"{'Student' if is_user else 'Tutor'}: {truncate_to_tokens(text.strip(), MEMORY_TURN_TOKENS)}"
+        for is_user, text in turns
+    )
+    max_words = MEMORY_SUMMARY_TOKENS * 3 // 4
+
+    prompt = (
+        "You maintain a running summary of a tutoring conversation.\n\n"
+        f"CURRENT SUMMARY:\n{previous_summary or '(empty)'}\n\n"
+        f"NEW TURNS:\n{transcript}\n\n"
+        f"Return an updated summary in at most {max_words} words. Keep the topics covered, "
+        "what the student struggled with and any preferences they stated. Drop small talk."
+    )
+
+    try:
+        response = client.models.generate_content(
+            model='gemini-2.5-flash',
+            contents=prompt
+        )
+        return truncate_to_tokens((response.text or "").strip(), MEMORY_SUMMARY_TOKENS)
+    except Exception as e:
+        print(f"⚠️ Summary Memory Error: {e}")
+        return None
+
+
+# --- PROVIDER CONTEXT CACHING ---
+# A course's notes are the same on every call, so they are uploaded once as a cached
+# prefix and later whole-course prompts (summaries) only send the part that changes.
+# Answers and quiz questions send a single passage and never run on top of the corpus.
+# main.py tracks the cache handle per course (CourseContextCache) and drops it when notes change.
+CACHE_TTL_SECONDS = 3600
+CACHE_REFRESH_MARGIN_SECONDS = 300   # Extend the TTL when less than this is left
+CACHE_MIN_TOKENS = 1024              # Provider minimum for explicit caching on Flash
+CACHE_MAX_TOKENS = 200000
+
+COURSE_INSTRUCTION = (
+    "You are Chokhmah, an intelligent, encouraging study companion. "
+    "The student's full course material is provided below. "
+    "Treat it as the only source of truth for every request about the course."
+)
+
+
+def build_course_corpus(note_texts):
+    """ The stable, cacheable part of every course prompt """
+    material = "\n\n".join(t for t in note_texts if t)
+    return f"--- COURSE MATERIAL ---\n{material}\n--- END OF COURSE MATERIAL ---\n\n"
+
+
+def is_cacheable(corpus):
+    return CACHE_MIN_TOKENS <= estimate_tokens(corpus) <= CACHE_MAX_TOKENS
+
+
+class GeminiContextCache:
+    """ Explicit context caching through the genai caches API """
+
+    def __init__(self, genai_client):
+        self.client = genai_client
+
+    def create(self, corpus, ttl_seconds, display_name=""):
+        cache = self.client.caches.create(
+            model='gemini-2.5-flash',
+            config=genai.types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=COURSE_INSTRUCTION,
+                contents=[corpus],
+                ttl=f"{ttl_seconds}s"
+            )
+        )
+        return cache.name
+
+    def refresh(self, name, ttl_seconds):
+        self.client.caches.update(
+            name=name,
+            config=genai.types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s")
+        )
+
+    def delete(self, name):
+        self.client.caches.delete(name=name)
+
+    def resolve(self, name, prompt):
+        """ Returns (contents, config) for a call on top of the cached prefix """
+        return prompt, {'cached_content': name}
+
+
+class LocalContextCache:
+    """
+    In-process stand-in with the same interface, for tests and offline runs.
+    Handles are deterministic (derived from the corpus) and the prefix is inlined on use.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def create(self, corpus, ttl_seconds, display_name=""):
+        name = "local-cache/" + hashlib.sha256(corpus.encode("utf-8")).hexdigest()[:16]
+        self.entries[name] = corpus
+        return name
+
+    def refresh(self, name, ttl_seconds):
+        if name not in self.entries:
+            raise KeyError(f"Unknown cache: {name}")
+
+    def delete(self, name):
+        self.entries.pop(name, None)
+
+    def resolve(self, name, prompt):
+        return f"{COURSE_INSTRUCTION}\n\n{self.entries[name]}{prompt}", {}
+
+
+# CONTEXT_CACHE_BACKEND: "gemini" (default when connected), "local" or "off"
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "gemini" if client else "local").lower()
+if CONTEXT_CACHE_BACKEND == "off":
+    context_cache = None
+elif CONTEXT_CACHE_BACKEND == "gemini" and client:
+    context_cache = GeminiContextCache(client)
+else:
+    context_cache = LocalContextCache()
+
+
+def run_model(prompt, cache_name=None, cached_prompt=None, config=None):
+    """
+    Sends `prompt` as-is, or only `cached_prompt` on top of the course cache when a
+    handle is given. A stale or expired handle falls back to the full prompt.
+    """
+    config = dict(config or {})
+
+    if cache_name and context_cache:
+        try:
+            contents, cache_config = context_cache.resolve(cache_name, cached_prompt or prompt)
+            return client.models.generate_content(
+                model='gemini-2.5-flash',
+                contents=contents,
+                config={**config, **cache_config} or None
+            )
+        except Exception as e:
+            print(f"⚠️ Context Cache Miss ({cache_name}): {e}")
+
+    return client.models.generate_content(
+        model='gemini-2.5-flash',
+        contents=prompt,
+        config=config or None
+    )
+
+
+def retrieve_context(user_question, full_text, memory_context=""):
+    """ Retrieval half of ask_bot: standalone query + best passage (safe to run speculatively) """
+    search_query = rewrite_query(user_question, memory_context)
+    return find_best_context(search_query, full_text)
+
+
+def ask_bot(user_question, full_text_history=None, memory_context="", context=None):
     """
     The main entry point for the frontend.
     Handles 'No File' vs 'With File' logic automatically.
+    memory_context is the bounded conversation history from build_memory_context.
+    context is a passage already retrieved for this question (e.g. prefetched while typing).
     """
     if not client:
         return "⚠️ Error: AI Engine is not connected."
 
+    memory_block = f"--- CONVERSATION SO FAR ---\n{memory_context}\n--- END ---\n\n" if memory_context else ""
+
     # CASE 1: GENERAL CHAT (No File Uploaded)
-    if not full_text_history:
+    if not full_text_history and context is None:
         print("ℹ️ No file loaded. Using General Tutor Mode.")
         prompt = (
             "You are Chokhmah, a helpful and encouraging AI tutor. "
             "The user has NOT uploaded any course notes yet.\n\n"
-            f"USER QUESTION: {user_question}\n\n"
             "INSTRUCTIONS:\n"
             "1. **BE COMPREHENSIVE:** Answer the student's question in detail. Do not give short, one-line answers.\n"
             "2. **TEACHING STYLE:** Explain concepts clearly, using examples if necessary.\n"
             "3. **REMINDER:** Gently remind the user they can upload a PDF to get answers specific to their curriculum.\n"
-            "4. **FORMATTING:** Use clean Markdown (Bold key terms, bullet points).\n"
+            "4. **FORMATTING:** Use clean Markdown (Bold key terms, bullet points).\n\n"
+            f"{memory_block}"
+            f"USER QUESTION: {user_question}\n"
         )
         try:
-            response = client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt
-            )
+            response = run_model(prompt)
             return response.text
         except Exception as e:
             return f"Error: {e}"
 
     # CASE 2: STRICT RAG (File IS Uploaded)
     else:
-        # 1. Retrieve Context using MindSpore
-        context = find_best_context(user_question, full_text_history)
+        # 1. Retrieve Context using MindSpore (with a standalone version of follow-ups)
+        if context is None:
+            context = retrieve_context(user_question, full_text_history, memory_context)
 
         # 2. Generate Answer with Context
-        return generate_answer(context, user_question)
+        return generate_answer(context, user_question, memory_context)
 
 # --- AI GENERATION ---
-def generate_answer(context, question):
+# Prompts are ordered stable-first (persona, instructions) so the provider can reuse the
+# shared prefix; the per-call parts (passage, memory, question) always come last.
+ANSWER_INSTRUCTIONS = (
+    "INSTRUCTIONS:\n"
+    "1. **BE COMPREHENSIVE:** Do not just give a one-line answer. Explain the concept fully using the provided context. Break it down so a student can understand.\n"
+    "2. **STRICT GROUNDING:** Use ONLY the information in the course material. Do not make up outside facts. "
+    "The conversation is only there to understand follow-up questions.\n"
+    "3. **FORMATTING:** Use **Bold** for key terms and lists for steps.\n"
+    "4. **MATH:** If there are formulas, show them clearly using LaTeX ($$).\n\n"
+)
+
+
+def generate_answer(context, question, memory_context=""):
     if not client: return "⚠️ Error: Google Client not active."
 
+    memory_block = f"--- CONVERSATION SO FAR ---\n{memory_context}\n--- END ---\n\n" if memory_context else ""
+
     # UPDATED PROMPT FOR VERBOSE ANSWERS
     prompt = (
         "You are Chokhmah, an intelligent, encouraging study companion.\n"
         "You are given excerpts from the student's course material.\n\n"
-
+        f"{ANSWER_INSTRUCTIONS}"
         f"--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
-
-        "USER QUESTION:\n"
-        f"{question}\n\n"
-
-        "INSTRUCTIONS:\n"
-        "1. **BE COMPREHENSIVE:** Do not just give a one-line answer. Explain the concept fully using the provided context. Break it down so a student can understand.\n"
-        "2. **STRICT GROUNDING:** Use ONLY the information in the context above. Do not make up outside facts.\n"
-        "3. **FORMATTING:** Use **Bold** for key terms and lists for steps.\n"
-        "4. **MATH:** If there are formulas, show them clearly using LaTeX ($$).\n"
+        f"{memory_block}"
+        f"USER QUESTION:\n{question}\n"
     )
 
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
+        response = run_model(prompt)
         return response.text
 
     except Exception as e:
@@ -213,18 +691,15 @@ def generate_quiz_question(full_text, difficulty="Medium", custom_topic=""):
     difficulty_instr = "Simple and direct." if difficulty == "Easy" else "Complex and tricky."
     topic_instr = f"Focus on: '{custom_topic}'." if custom_topic else ""
 
-    prompt = (
-        f"Generate 1 multiple-choice question based on:\n'{selected_text}'\n"
+    task = (
+        "Generate 1 multiple-choice question.\n"
+        "Return ONLY valid JSON with keys: 'question', 'options', 'answer'.\n"
         f"Difficulty: {difficulty}. {topic_instr} {difficulty_instr}\n"
-        f"Return ONLY valid JSON with keys: 'question', 'options', 'answer'."
     )
+    prompt = f"{task}Base it on:\n'{selected_text}'\n"
 
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt,
-            config={'response_mime_type': 'application/json'}
-        )
+        response = run_model(prompt, config={'response_mime_type': 'application/json'})
 
         raw = response.text.replace("```json", "").replace("```", "").strip()
         data = json.loads(raw)
@@ -238,22 +713,23 @@ def generate_quiz_question(full_text, difficulty="Medium", custom_topic=""):
 
 
 # --- SUMMARY GENERATION ---
-def generate_summary(full_text, topic=""):
+def generate_summary(full_text, topic="", cache_name=None):
     if not client: return "AI Engine not connected."
 
     truncated_text = full_text[:4000]
 
+    # The cached corpus holds every note, so a cached summary is not limited to 4000 chars
     if topic:
         prompt = f"Summarize the following text focusing specifically on '{topic}':\n\n{truncated_text}"
+        cached_prompt = f"Summarize the course material focusing specifically on '{topic}'."
     else:
         prompt = (f"Summarize the following study material into 3-6 key bullet points, but"
                   f"if more key point can be made use do that:\n\n{truncated_text}")
+        cached_prompt = ("Summarize the course material into 3-6 key bullet points, but "
+                         "if more key points can be made, use them.")
 
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
+        response = run_model(prompt, cache_name=cache_name, cached_prompt=cached_prompt)
         return response.text
     except Exception as e:
-        return f"Error generating summary: {e}"
\ No newline at end of file
+        return f"Error generating summary: {e}"
@@ -1,16 +1,47 @@
 import os
 import json
-from flask import Flask, jsonify, request, render_template, session, redirect, url_for, flash, send_from_directory
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import (Flask, jsonify, request, render_template, session, redirect, url_for, flash, send_from_directory,
+                   abort)
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Note, ChatMessage, Course, QuizResult, QuizSession
+from models import (db, User, Note, ChatMessage, Course, QuizResult, QuizSession, CourseMemory,
+                    CourseContextCache)
 from ai_engine import (generate_quiz_question, extract_text_from_file,
-                       generate_summary, ask_bot)
-from sqlalchemy import func
+                       generate_summary, ask_bot, retrieve_context, build_memory_context, update_rolling_summary,
+                       context_cache, build_course_corpus, is_cacheable,
+                       CACHE_TTL_SECONDS, CACHE_REFRESH_MARGIN_SECONDS)
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import IntegrityError
 
 app = Flask(__name__)
 global_pdf_text = ""
 
+# Number of chat messages sent to the study page per history request
+HISTORY_PAGE_SIZE = 50
+
+# Conversation memory: the newest messages are sent verbatim, older ones are folded
+# into CourseMemory.summary by a single background worker (never on the request path)
+MEMORY_RECENT_MESSAGES = 6
+MEMORY_FOLD_BATCH = 20
+memory_executor = ThreadPoolExecutor(max_workers=1)
+pending_memory_refresh = set()
+
+# Speculative retrieval: /api/retrieve/preview fills this while the user types and
+# /api/chat reuses the entry when the sent message matches the draft
+PREFETCH_CACHE_SIZE = 256
+PREFETCH_TTL_SECONDS = 120
+PREFETCH_MIN_CHARS = 8
+prefetch_cache = OrderedDict()   # (course_id, note_ids, query) -> {context, memory_context, created}
+prefetch_generation = OrderedDict()  # (user_id, course_id) -> id of the newest preview request
+prefetch_stats = {"previews": 0, "superseded": 0, "lookups": 0, "hits": 0, "stale": 0}
+prefetch_lock = threading.Lock()
+
 # --- CONFIGURATION ---
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///project.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -24,9 +55,35 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Connect DB
 db.init_app(app)
 
+# Columns added after the first release. create_all() never alters existing tables,
+# so they are added here for databases created by an older version.
+ADDED_COLUMNS = {
+    'course': {
+        'is_template': 'BOOLEAN DEFAULT 0',
+        'template_id': 'INTEGER REFERENCES course (id)',
+        'notes_detached': 'BOOLEAN DEFAULT 0',
+    },
+    'note': {
+        'source_note_id': 'INTEGER REFERENCES note (id)',
+        'stored_name': 'VARCHAR(200)',
+    },
+}
+
+
+def upgrade_schema():
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
 # Create Tables
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 
 
 # --- AUTH ROUTES ---
@@ -87,7 +144,15 @@ def ask():
 def home():
     if 'user_id' not in session: return redirect(url_for('login'))
     user_courses = Course.query.filter_by(user_id=session['user_id']).all()
-    return render_template("courses.html", username=session.get('username'), courses=user_courses)
+
+    # Published templates from other users that this student has not enrolled in yet
+    enrolled_ids = {c.template_id for c in user_courses if c.template_id}
+    templates = [t for t in Course.query.filter(Course.is_template == True,
+                                                Course.user_id != session['user_id']).all()
+                 if t.id not in enrolled_ids]
+
+    return render_template("courses.html", username=session.get('username'), courses=user_courses,
+                           templates=templates)
 
 
 @app.route('/create_course', methods=['POST'])
@@ -104,24 +169,161 @@ def create_course():
 def study(course_id):
     if 'user_id' not in session: return redirect(url_for('login'))
     course = Course.query.get_or_404(course_id)
-    notes = Note.query.filter_by(course_id=course_id).all()
-    history = ChatMessage.query.filter_by(course_id=course_id).order_by(ChatMessage.timestamp).all()
+    notes = get_course_notes(course)
+
+    # Only the newest page is sent; older messages are fetched as the user scrolls up
+    history, has_more = get_history_page(course_id)
 
     return render_template("index.html",
                            course=course,
                            notes=notes,
                            history=history,
+                           has_more=has_more,
                            username=session.get('username'))
 
 
+def get_history_page(course_id, before_id=None, limit=HISTORY_PAGE_SIZE):
+    """ Returns (messages, has_more) for the `limit` messages older than before_id, oldest first """
+    query = ChatMessage.query.filter_by(course_id=course_id)
+    if before_id:
+        query = query.filter(ChatMessage.id < before_id)
+
+    # Fetch one extra row so we know whether another page exists
+    rows = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit][::-1]
+
+    messages = [{'id': m.id, 'text': m.text, 'is_user': m.is_user} for m in rows]
+    return messages, has_more
+
+
+# --- COURSE TEMPLATES (Copy-on-write sharing of an instructor's notes) ---
+def shares_template_notes(course):
+    return course.template_id is not None and not course.notes_detached
+
+
+def notes_owner_id(course):
+    """ The course whose note rows (and context cache) this course currently reads """
+    return course.template_id if shares_template_notes(course) else course.id
+
+
+def get_course_notes(course, note_ids=None):
+    """
+    Notes visible in a course. An enrolled course reads the template's notes directly;
+    note_ids may name either a note or the template note it was copied from.
+    """
+    notes = Note.query.filter_by(course_id=notes_owner_id(course)).all()
+    if note_ids:
+        wanted = set(note_ids)
+        notes = [n for n in notes if n.id in wanted or n.source_note_id in wanted]
+    return notes
+
+
+def materialize_template_notes(course):
+    """
+    Copy-on-write: the first time a student adds, removes or renames a note, the template's
+    notes become rows of their own course. Copies only point at the template note, so
+    extracted text and files are still stored once.
+    """
+    if not shares_template_notes(course): return
+
+    for note in Note.query.filter_by(course_id=course.template_id).all():
+        db.session.add(Note(filename=note.filename, source_note_id=note.id, course_id=course.id))
+    course.notes_detached = True
+    db.session.flush()
+
+
+def get_writable_note(note_id, course_id):
+    """ The note row the current user may change, copying template notes on first write """
+    note = Note.query.get_or_404(note_id)
+    course = Course.query.get(course_id) if course_id else None
+
+    if course and note.course_id != course.id and note.course_id == course.template_id:
+        # Only the student who owns the enrolled course may trigger the copy
+        if course.user_id != session['user_id']: abort(403)
+        materialize_template_notes(course)
+        note = Note.query.filter_by(course_id=course.id, source_note_id=note_id).first_or_404()
+
+    # Template notes are read-only for everyone but their owner
+    if note.course.user_id != session['user_id']: abort(403)
+    return note
+
+
+def release_note_copies(note):
+    """
+    A shared note is going away: one of its copies becomes the new source (taking over the
+    extracted text) and the other copies point at it, so the text is still stored once.
+    """
+    copies = Note.query.filter_by(source_note_id=note.id).order_by(Note.id).all()
+    if not copies: return
+
+    heir = copies[0]
+    heir.extracted_text = note.text
+    heir.stored_name = note.stored_filename  # The copy may have been renamed; the file was not
+
+    # Go through the relationship: deleting the note later nulls whatever its `copies`
+    # backref still holds, which would cut the other copies off from the text
+    heir.source = None
+    for copy in copies[1:]:
+        copy.source = heir
+    db.session.flush()
+    db.session.expire(note, ['copies'])
+
+
+@app.route('/api/course/<int:course_id>/publish', methods=['POST'])
+def publish_course(course_id):
+    if 'user_id' not in session: return jsonify({"error": "Unauthorized"}), 401
+    course = Course.query.get_or_404(course_id)
+    if course.user_id != session['user_id']: return jsonify({"error": "Forbidden"}), 403
+    if course.template_id: return jsonify({"error": "Enrolled courses cannot be published"}), 400
+
+    course.is_template = not course.is_template
+    db.session.commit()
+    return jsonify({"is_template": course.is_template})
+
+
+@app.route('/enroll/<int:template_id>', methods=['POST'])
+def enroll(template_id):
+    if 'user_id' not in session: return redirect(url_for('login'))
+    template = Course.query.get_or_404(template_id)
+    if not template.is_template: abort(404)
+    if template.user_id == session['user_id']: return redirect(url_for('study', course_id=template.id))
+
+    # Already enrolled: go back to the existing course instead of creating another one
+    existing = Course.query.filter_by(user_id=session['user_id'], template_id=template.id).first()
+    if existing: return redirect(url_for('study', course_id=existing.id))
+
+    # O(1): the new course only points at the template, nothing is copied
+    new_course = Course(title=template.title, user_id=session['user_id'], template_id=template.id)
+    db.session.add(new_course)
+    db.session.commit()
+    return redirect(url_for('study', course_id=new_course.id))
+
+
+@app.route('/api/chat/history', methods=['GET'])
+def chat_history():
+    if 'user_id' not in session: return jsonify({"error": "Unauthorized"}), 401
+
+    course_id = request.args.get('course_id', type=int)
+    before_id = request.args.get('before_id', type=int)
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_PAGE_SIZE))
+
+    messages, has_more = get_history_page(course_id, before_id, limit)
+    return jsonify({"messages": messages, "has_more": has_more})
+
+
 # THE UPLOAD ROUTE
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     if 'user_id' not in session: return jsonify({"error": "Unauthorized"}), 401
-    course_id = request.form.get('course_id')
+    course_id = request.form.get('course_id', type=int)
     files = request.files.getlist('file')  # <--- Must match JS formData
     saved_files_data = []
 
+    # Adding own notes to an enrolled course copies the template's notes first
+    course = Course.query.get_or_404(course_id)
+    materialize_template_notes(course)
+
     for file in files:
         if file.filename == '': continue
         filename = secure_filename(file.filename)
@@ -142,6 +344,7 @@ def upload_file():
 
         saved_files_data.append({'id': new_note.id, 'name': filename})
 
+    invalidate_course_cache(course_id)
     return jsonify({"message": "Files processed", "files": saved_files_data})
 
 
@@ -154,14 +357,15 @@ def get_summary():
     course_id = data.get('course_id')
     topic = data.get('topic', '')
 
-    notes = Note.query.filter_by(course_id=course_id).all()
+    course = Course.query.get_or_404(course_id)
+    notes = get_course_notes(course)
     if not notes:
         return jsonify({"summary": "No notes uploaded yet."})
 
-    full_text = " ".join([n.extracted_text for n in notes if n.extracted_text])
+    full_text = notes_text(notes)
 
     # Generate Summary
-    summary_text = generate_summary(full_text, topic)
+    summary_text = generate_summary(full_text, topic, cache_name=get_course_cache(notes_owner_id(course), notes))
 
     # ---Saved to Database, so it persists in Chat History ---
     formatted_summary = f"**📝 Study Summary**\n\n{summary_text}"
@@ -170,6 +374,8 @@ def get_summary():
     db.session.add(new_msg)
     db.session.commit()
 
+    schedule_memory_refresh(course_id)
+
     return jsonify({"summary": formatted_summary})
 
 
@@ -178,10 +384,13 @@ def get_summary():
 def upload_ocr_file():
     if 'user_id' not in session: return jsonify({"error": "Unauthorized"}), 401
 
-    course_id = request.form.get('course_id')
+    course_id = request.form.get('course_id', type=int)
     files = request.files.getlist('file')
     saved_data = []
 
+    course = Course.query.get_or_404(course_id)
+    materialize_template_notes(course)
+
     for file in files:
         if not file.filename: continue
         filename = secure_filename("OCR_" + file.filename)  # Prefix to verify it worked
@@ -197,6 +406,7 @@ def upload_ocr_file():
         db.session.commit()
         saved_data.append({'id': new_note.id, 'name': filename})
 
+    invalidate_course_cache(course_id)
     return jsonify({"message": "OCR processing complete", "files": saved_data})
 
 
@@ -214,20 +424,20 @@ def chat():
     difficulty = data.get('difficulty', 'Medium')
     custom_topic = data.get('custom_topic', '')
 
-    # 1. Save User Message
-    msg = ChatMessage(text=user_message, is_user=True, course_id=course_id)
-    db.session.add(msg)
+    # 1. Load bounded memory (before this message is added)
+    memory_context = load_conversation_memory(course_id)
 
-    # 2. Gather Text Context
-    query = Note.query.filter_by(course_id=course_id)
-    if selected_note_ids:
-        query = query.filter(Note.id.in_(selected_note_ids))
-    course_notes = query.all()
+    # 2. Gather Text Context (an enrolled course reads the template's notes)
+    course = Course.query.get_or_404(course_id)
+    course_notes = get_course_notes(course, selected_note_ids)
 
-    full_text = " ".join([n.extracted_text for n in course_notes if n.extracted_text])
+    # Save User Message
+    msg = ChatMessage(text=user_message, is_user=True, course_id=course_id)
+    db.session.add(msg)
 
     # 3. CHECK: QUIZ MODE
-    if user_message.lower().strip() == "/quiz" or "quiz me" in user_message.lower():
+    if is_quiz_request(user_message):
+        full_text = notes_text(course_notes)
         if not full_text.strip():
             return jsonify({"response": "⚠️ Please upload notes before starting a quiz.", "is_quiz": False})
 
@@ -240,8 +450,13 @@ def chat():
     # 4. NORMAL CHAT (Unified Logic)
     # We use ask_bot from ai_engine because it ALREADY handles "No File" vs "With File" logic
     try:
+        # Prefetched while typing? Then only generation is left to do
+        context = take_prefetched_context(course.id, course_notes, user_message, memory_context)
+        full_text = notes_text(course_notes) if context is None else None
+
         # If full_text is empty, ask_bot will automatically treat it as General Chat
-        response_text = ask_bot(user_message, full_text_history=full_text)
+        response_text = ask_bot(user_message, full_text_history=full_text, memory_context=memory_context,
+                                context=context)
     except Exception as e:
         response_text = f"System Error: {str(e)}"
 
@@ -250,9 +465,278 @@ def chat():
     db.session.add(ai_msg)
     db.session.commit()
 
+    schedule_memory_refresh(course_id)
+
     return jsonify({"response": response_text, "is_quiz": False})
 
 
+def is_quiz_request(message):
+    return message.lower().strip() == "/quiz" or "quiz me" in message.lower()
+
+
+def notes_text(notes):
+    return " ".join([n.text for n in notes if n.text])
+
+
+# --- SPECULATIVE RETRIEVAL (Prefetch while typing) ---
+def normalize_query(message):
+    return " ".join(message.lower().split())
+
+
+def prefetch_key(course_id, notes, message):
+    # Keyed by the resolved note ids, so uploads/deletes never hit an old entry
+    return course_id, tuple(sorted(n.id for n in notes)), normalize_query(message)
+
+
+def take_prefetched_context(course_id, notes, message, memory_context):
+    """ Returns the prefetched passage for this exact message, or None on a miss """
+    if not notes: return None
+    key = prefetch_key(course_id, notes, message)
+
+    with prefetch_lock:
+        prefetch_stats["lookups"] += 1
+        entry = prefetch_cache.pop(key, None)
+        if entry is None:
+            return None
+        # A new turn or summary since the preview changes how follow-ups are rewritten
+        if entry["memory_context"] != memory_context or \
+                time.time() - entry["created"] > PREFETCH_TTL_SECONDS:
+            prefetch_stats["stale"] += 1
+            return None
+        prefetch_stats["hits"] += 1
+        return entry["context"]
+
+
+def store_prefetched_context(key, context, memory_context):
+    with prefetch_lock:
+        prefetch_cache[key] = {"context": context, "memory_context": memory_context, "created": time.time()}
+        prefetch_cache.move_to_end(key)
+        while len(prefetch_cache) > PREFETCH_CACHE_SIZE:
+            prefetch_cache.popitem(last=False)
+
+
+def start_preview(owner):
+    """ Registers a new preview for owner and returns its generation (older ones are superseded) """
+    with prefetch_lock:
+        prefetch_stats["previews"] += 1
+        generation = prefetch_generation.get(owner, 0) + 1
+        prefetch_generation[owner] = generation
+        prefetch_generation.move_to_end(owner)
+        while len(prefetch_generation) > PREFETCH_CACHE_SIZE:
+            prefetch_generation.popitem(last=False)
+        return generation
+
+
+def is_superseded(owner, generation):
+    with prefetch_lock:
+        if prefetch_generation.get(owner) == generation:
+            return False
+        prefetch_stats["superseded"] += 1
+        return True
+
+
+@app.route('/api/retrieve/preview', methods=['POST'])
+def retrieve_preview():
+    if 'user_id' not in session: return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.json
+    message = data.get('message', '')
+    if len(normalize_query(message)) < PREFETCH_MIN_CHARS or is_quiz_request(message):
+        return jsonify({"status": "skipped"})
+
+    course = Course.query.get_or_404(data.get('course_id'))
+
+    # Every keystroke burst supersedes the previous preview of this user in this course
+    owner = (session['user_id'], course.id)
+    generation = start_preview(owner)
+
+    notes = get_course_notes(course, data.get('note_ids') or None)
+    if not notes:
+        return jsonify({"status": "skipped"})
+
+    key = prefetch_key(course.id, notes, message)
+    with prefetch_lock:
+        entry = prefetch_cache.get(key)
+    if entry and time.time() - entry["created"] <= PREFETCH_TTL_SECONDS:
+        return jsonify({"status": "cached"})
+
+    memory_context = load_conversation_memory(course.id)
+
+    # A newer draft already arrived: skip the retrieval (and its rewrite LLM call) entirely
+    if is_superseded(owner, generation):
+        return jsonify({"status": "superseded"})
+
+    context = retrieve_context(message, notes_text(notes), memory_context)
+
+    # A newer draft arrived while this one was being retrieved: drop the result
+    if is_superseded(owner, generation):
+        return jsonify({"status": "superseded"})
+
+    store_prefetched_context(key, context, memory_context)
+    return jsonify({"status": "ready"})
+
+
+@app.route('/api/retrieve/stats', methods=['GET'])
+def retrieve_stats():
+    """ Prefetch hit rate, used to tune the debounce in script.js """
+    if 'user_id' not in session: return jsonify({"error": "Unauthorized"}), 401
+
+    with prefetch_lock:
+        stats = dict(prefetch_stats)
+        stats["cached_entries"] = len(prefetch_cache)
+    stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+    return jsonify(stats)
+
+
+# --- CONVERSATION MEMORY ---
+def load_conversation_memory(course_id):
+    """ Bounded memory block for the prompt: rolling summary + last few messages """
+    memory = CourseMemory.query.filter_by(course_id=course_id).first()
+    recent = ChatMessage.query.filter_by(course_id=course_id) \
+        .order_by(ChatMessage.id.desc()).limit(MEMORY_RECENT_MESSAGES).all()
+
+    turns = [(m.is_user, m.text) for m in reversed(recent)]
+    return build_memory_context(memory.summary if memory else "", turns)
+
+
+def schedule_memory_refresh(course_id):
+    """ Queue a summary refresh for this course unless one is already waiting """
+    if course_id in pending_memory_refresh: return
+    pending_memory_refresh.add(course_id)
+    memory_executor.submit(refresh_course_memory, course_id)
+
+
+def refresh_course_memory(course_id):
+    """
+    Folds messages that fell out of the recent window into the rolling summary, batch by
+    batch, until the summary reaches the window (long existing chats catch up in one run)
+    """
+    pending_memory_refresh.discard(course_id)
+
+    with app.app_context():
+        try:
+            recent = ChatMessage.query.filter_by(course_id=course_id) \
+                .order_by(ChatMessage.id.desc()).limit(MEMORY_RECENT_MESSAGES).all()
+            if len(recent) < MEMORY_RECENT_MESSAGES: return
+            window_start = recent[-1].id
+
+            memory = CourseMemory.query.filter_by(course_id=course_id).first()
+            if not memory:
+                memory = CourseMemory(course_id=course_id, summary="", last_message_id=0)
+                db.session.add(memory)
+
+            while True:
+                to_fold = ChatMessage.query.filter(ChatMessage.course_id == course_id,
+                                                   ChatMessage.id > (memory.last_message_id or 0),
+                                                   ChatMessage.id < window_start) \
+                    .order_by(ChatMessage.id).limit(MEMORY_FOLD_BATCH).all()
+                if not to_fold: return
+
+                new_summary = update_rolling_summary(memory.summary, [(m.is_user, m.text) for m in to_fold])
+                if new_summary is None: return  # Keep the old summary; the next turn retries
+
+                memory.summary = new_summary
+                memory.last_message_id = to_fold[-1].id
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Memory Refresh Error: {e}")
+        finally:
+            db.session.remove()
+
+
+# --- PROVIDER CONTEXT CACHE ---
+def get_course_cache(course_id, notes):
+    """
+    Returns a live cache handle for the course notes, creating or extending it as needed.
+    Returns None when caching is off, the corpus is too small/large, or the provider fails.
+    """
+    if not context_cache: return None
+
+    entry = CourseContextCache.query.filter_by(course_id=course_id).first()
+    now = datetime.utcnow()
+
+    # 0. Fresh entry: note changes always invalidate it, so skip re-reading the notes
+    if entry and entry.expires_at - now > timedelta(seconds=CACHE_REFRESH_MARGIN_SECONDS):
+        return entry.cache_name
+
+    corpus = build_course_corpus([n.text for n in notes])
+    if not is_cacheable(corpus): return None
+    content_hash = hashlib.sha256(corpus.encode("utf-8")).hexdigest()
+
+    # 1. Same notes but about to expire: extend the TTL
+    if entry and entry.content_hash == content_hash and entry.expires_at > now:
+        try:
+            context_cache.refresh(entry.cache_name, CACHE_TTL_SECONDS)
+            entry.expires_at = now + timedelta(seconds=CACHE_TTL_SECONDS)
+            db.session.commit()
+            return entry.cache_name
+        except Exception as e:
+            print(f"⚠️ Cache Refresh Error: {e}")
+
+    # 2. Missing, stale or expired: reuse a live cache of identical notes (e.g. a template
+    #    and its enrolled copies), otherwise upload the corpus again
+    if entry:
+        invalidate_course_cache(course_id)
+    shared = CourseContextCache.query.filter(CourseContextCache.content_hash == content_hash,
+                                             CourseContextCache.expires_at > now).first()
+    created = False
+    if shared:
+        cache_name, expires_at = shared.cache_name, shared.expires_at
+    else:
+        try:
+            cache_name = context_cache.create(corpus, CACHE_TTL_SECONDS, display_name=f"course-{course_id}")
+        except Exception as e:
+            print(f"⚠️ Cache Create Error: {e}")
+            return None
+        expires_at = now + timedelta(seconds=CACHE_TTL_SECONDS)
+        created = True
+
+    try:
+        db.session.add(CourseContextCache(
+            course_id=course_id,
+            cache_name=cache_name,
+            content_hash=content_hash,
+            expires_at=expires_at
+        ))
+        db.session.commit()
+        return cache_name
+    except IntegrityError:
+        # A concurrent request stored a cache for this course first: use theirs and
+        # delete the handle we just created so it is not billed until its TTL runs out
+        db.session.rollback()
+        if created:
+            try:
+                context_cache.delete(cache_name)
+            except Exception as e:
+                print(f"⚠️ Cache Delete Error: {e}")
+        winner = CourseContextCache.query.filter_by(course_id=course_id).first()
+        return winner.cache_name if winner else None
+
+
+def invalidate_course_cache(course_id):
+    """ Notes changed: drop the cached corpus so the next call uploads the new one """
+    entry = CourseContextCache.query.filter_by(course_id=course_id).first()
+    if not entry: return
+
+    cache_name = entry.cache_name
+    db.session.delete(entry)
+    db.session.commit()
+    release_provider_cache(cache_name)
+
+
+def release_provider_cache(cache_name):
+    """ Deletes a provider cache once no course row points at it any more """
+    if not cache_name or not context_cache: return
+
+    # Other courses with identical notes may still use the same provider cache
+    if CourseContextCache.query.filter_by(cache_name=cache_name).count(): return
+    try:
+        context_cache.delete(cache_name)
+    except Exception as e:
+        print(f"⚠️ Cache Delete Error: {e}")
+
+
 # --- NEW ROUTE: START QUIZ SESSION ---
 @app.route('/api/quiz/start_session', methods=['POST'])
 def start_session():
@@ -320,9 +804,12 @@ def quiz_history(course_id):
 @app.route('/api/note/<int:note_id>', methods=['DELETE'])
 def delete_note(note_id):
     if 'user_id' not in session: return 401
-    note = Note.query.get_or_404(note_id)
+    note = get_writable_note(note_id, request.args.get('course_id', type=int))
+    course_id = note.course_id
+    release_note_copies(note)
     db.session.delete(note)
     db.session.commit()
+    invalidate_course_cache(course_id)
     return jsonify({"message": "Deleted"})
 
 
@@ -330,7 +817,7 @@ def delete_note(note_id):
 def rename_note(note_id):
     if 'user_id' not in session: return 401
     data = request.json
-    note = Note.query.get_or_404(note_id)
+    note = get_writable_note(note_id, request.args.get('course_id', type=int))
     note.filename = data.get('new_name')
     db.session.commit()
     return jsonify({"message": "Renamed"})
@@ -340,7 +827,7 @@ def rename_note(note_id):
 def view_file(note_id):
     if 'user_id' not in session: return 401
     note = Note.query.get_or_404(note_id)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], note.filename)
+    return send_from_directory(app.config['UPLOAD_FOLDER'], note.stored_filename)
 
 
 @app.route('/api/course/<int:course_id>', methods=['DELETE'])
@@ -349,8 +836,17 @@ def delete_course(course_id):
     course = Course.query.get_or_404(course_id)
     if course.user_id != session['user_id']: return 403
 
-    Note.query.filter_by(course_id=course_id).delete()
+    # Students enrolled in this template keep their notes: give them their own copies first
+    for enrolled in course.enrollments:
+        materialize_template_notes(enrolled)
+        enrolled.template_id = None
+    for note in course.notes:
+        release_note_copies(note)
+
+    # Notes go with the course cascade (they are loaded above, a bulk delete would leave stale rows)
     ChatMessage.query.filter_by(course_id=course_id).delete()
+    CourseMemory.query.filter_by(course_id=course_id).delete()
+    cache_name = course.context_cache.cache_name if course.context_cache else None
 
     #  delete history
     QuizSession.query.filter_by(course_id=course_id).delete()
@@ -358,6 +854,7 @@ def delete_course(course_id):
 
     db.session.delete(course)
     db.session.commit()
+    release_provider_cache(cache_name)
     return jsonify({"message": "Course deleted"})
 
 
@@ -22,13 +22,27 @@ class Course(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Templates: an instructor publishes a course, students enroll into it.
+    # An enrolled course reads the template's notes until the student changes them (copy-on-write).
+    is_template = db.Column(db.Boolean, default=False)
+    template_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=True)
+    notes_detached = db.Column(db.Boolean, default=False)  # True once the student has own note rows
+
     # Relationships
+    template = db.relationship('Course', remote_side=[id], backref='enrollments')
     notes = db.relationship('Note', backref='course', lazy=True, cascade="all, delete-orphan")
     messages = db.relationship('ChatMessage', backref='course', lazy=True, cascade="all, delete-orphan")
 
     # Link to Quiz Sessions (Groups of questions)
     quiz_sessions = db.relationship('QuizSession', backref='course', lazy=True, cascade="all, delete-orphan")
 
+    # Rolling conversation summary (one row per course)
+    memory = db.relationship('CourseMemory', backref='course', uselist=False, cascade="all, delete-orphan")
+
+    # Provider-side cache of the course notes (one row per course)
+    context_cache = db.relationship('CourseContextCache', backref='course', uselist=False,
+                                    cascade="all, delete-orphan")
+
 
 # Chat Message
 class ChatMessage(db.Model):
@@ -40,6 +54,27 @@ class ChatMessage(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
 
 
+# Conversation Memory (Rolling summary of chat turns older than the recent window)
+class CourseMemory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    summary = db.Column(db.Text, default="")
+    last_message_id = db.Column(db.Integer, default=0)  # Newest ChatMessage folded into the summary
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, unique=True)
+
+
+# Context Cache (Handle of the course notes uploaded to the provider as a cached prefix)
+class CourseContextCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_name = db.Column(db.String(200), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 of the cached corpus
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, unique=True)
+
+
 # Notes
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -49,6 +84,23 @@ class Note(db.Model):
 
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
 
+    # Copy-on-write copy of a template note: shares its file and extracted text
+    source_note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=True)
+    stored_name = db.Column(db.String(200), nullable=True)  # File on disk, set when a copy becomes a source
+    source = db.relationship('Note', remote_side=[id], backref='copies')
+
+    @property
+    def text(self):
+        """ Extracted text, read through to the template note for copies """
+        return self.source.extracted_text if self.source_note_id else self.extracted_text
+
+    @property
+    def stored_filename(self):
+        """ Name of the file in the uploads folder (copies point at the template's file) """
+        if self.source_note_id:
+            return self.source.stored_filename
+        return self.stored_name or self.filename
+
 
 # Quiz Session (The "Folder" for a set of questions)
 class QuizSession(db.Model):
@@ -14,8 +14,8 @@ function getCourseId() {
 }
 
 function scrollToBottom() {
-    var chatBox = document.getElementById("chatBox");
-    if(chatBox) chatBox.scrollTop = chatBox.scrollHeight;
+    chatList.stickToBottom = true;
+    renderChatWindow();
 }
 
 // --- Tab & UI Logic ---
@@ -38,22 +38,65 @@ function switchTab(tabName) {
 }
 
 
-// ---UPDATED appendMessage FUNCTION ---
-function appendMessage(text, sender) {
-    const chatBox = document.getElementById('chatBox');
+// --- VIRTUALIZED CHAT LIST ---
+// Only the messages near the viewport live in the DOM. Every other message is kept in
+// chatList.items as cached HTML plus its last measured height, so a long course costs
+// the same per frame as a short one.
+const CHAT_BUFFER_PX = 800;        // Extra pixels kept mounted above/below the viewport
+const CHAT_ESTIMATED_HEIGHT = 90;  // Used until a message has been measured once
+const CHAT_ROW_MARGIN = 15;        // Matches .chat-window > .message in style.css
+
+let chatList = {
+    items: [],            // {id, text, sender, html, rawHtml, node, quizBubble, height}
+    mounted: new Map(),   // item -> DOM node currently inside #chatWindow
+    hasMore: false,
+    loadingOlder: false,
+    stickToBottom: false,
+    framePending: false,
+    box: null, topSpacer: null, windowEl: null, bottomSpacer: null
+};
+
+function renderMarkdown(text) {
+    // Markdown + LaTeX are rendered once per message; the result is cached on the item
+    const tempDiv = document.createElement('div');
+    tempDiv.innerHTML = marked.parse(text.trim());
+    if (window.renderMathInElement) {
+        renderMathInElement(tempDiv, {
+            delimiters: [
+                {left: "$$", right: "$$", display: true},
+                {left: "$", right: "$", display: false}
+            ]
+        });
+    }
+    return tempDiv.innerHTML;
+}
+
+function createChatItem(text, sender, extra = {}) {
+    return Object.assign({
+        id: null, text: text, sender: sender,
+        html: null, rawHtml: null, node: null, quizBubble: false,
+        height: CHAT_ESTIMATED_HEIGHT
+    }, extra);
+}
+
+function buildMessageNode(item) {
+    // Quiz bubbles keep their node so an answered quiz stays answered after scrolling away
+    if (item.node) return item.node;
+
+    const text = item.text;
     const msgDiv = document.createElement('div');
-    msgDiv.classList.add('message', sender);
+    msgDiv.classList.add('message', item.sender);
+    if (item.quizBubble) msgDiv.classList.add('quiz-bubble');
 
     // CASE A: Saved Quiz Data
     if (typeof text === 'string' && text.includes("[QUIZ_DATA]")) {
         try {
             const quizJson = JSON.parse(text.replace("[QUIZ_DATA]", "").trim());
             renderInteractiveQuiz(quizJson, msgDiv);
-            chatBox.appendChild(msgDiv);
-            scrollToBottom();
-            return;
+            item.node = msgDiv;
         } catch (e) {
             console.error("Error parsing history quiz:", e);
+            msgDiv.innerText = "⚠️ Error loading quiz.";
         }
     }
 
@@ -61,41 +104,212 @@ function appendMessage(text, sender) {
     else if (typeof text === 'object' && text !== null) {
         if (text.question) {
             renderInteractiveQuiz(text, msgDiv);
+            item.node = msgDiv;
         } else {
              msgDiv.innerText = "⚠️ Invalid Quiz Object";
         }
     }
 
-    // CASE C: Normal Text (Fixed)
-    else {
-        // Render Text
-        if (sender === 'bot') {
-            msgDiv.innerHTML = marked.parse(text);
+    // CASE C: Loading indicators (trusted, pre-built HTML)
+    else if (item.rawHtml !== null) {
+        msgDiv.innerHTML = item.rawHtml;
+    }
+
+    // CASE D: Normal Text
+    else if (item.sender === 'bot') {
+        if (item.html === null) item.html = renderMarkdown(text);
+        msgDiv.innerHTML = item.html;
+
+        const btn = document.createElement("button");
+        btn.innerHTML = "🔊"; // Or use an SVG icon
+        btn.className = "voice-btn"; // Add CSS for this class!
+        btn.style.marginLeft = "10px";
+        btn.style.cursor = "pointer";
+        btn.style.border = "none";
+        btn.style.background = "transparent";
+
+        // On Click -> Read Aloud
+        btn.onclick = () => speakText(text);
 
-            const btn = document.createElement("button");
-            btn.innerHTML = "🔊"; // Or use an SVG icon
-            btn.className = "voice-btn"; // Add CSS for this class!
-            btn.style.marginLeft = "10px";
-            btn.style.cursor = "pointer";
-            btn.style.border = "none";
-            btn.style.background = "transparent";
+        msgDiv.appendChild(btn);
 
-            // On Click -> Read Aloud
-            btn.onclick = () => speakText(text);
+        // OPTIONAL: Auto-speak immediately - will set for Blind people
+        // speakText(text);
+
+    } else {
+        msgDiv.innerText = text;
+    }
+
+    return msgDiv;
+}
+
+function chatViewTop() {
+    // Distance from the start of the list (top spacer) to the top of the visible area
+    return chatList.box.getBoundingClientRect().top - chatList.topSpacer.getBoundingClientRect().top;
+}
+
+function scheduleChatRender() {
+    if (chatList.framePending) return;
+    chatList.framePending = true;
+    requestAnimationFrame(renderChatWindow);
+}
+
+function renderChatWindow() {
+    chatList.framePending = false;
+    const box = chatList.box;
+    if (!box) return;
+
+    const items = chatList.items;
+
+    // A few passes at most: measuring can change heights, which moves the bottom
+    for (let pass = 0; pass < 3; pass++) {
+        const viewTop = chatViewTop();
+        const rangeTop = viewTop - CHAT_BUFFER_PX;
+        const rangeBottom = viewTop + box.clientHeight + CHAT_BUFFER_PX;
+
+        // 1. Find the slice of messages that overlaps the viewport (+ buffer)
+        let offset = 0, start = -1, end = -1, startOffset = 0;
+        for (let i = 0; i < items.length; i++) {
+            const h = items[i].height;
+            if (start < 0 && offset + h >= rangeTop) { start = i; startOffset = offset; }
+            if (offset <= rangeBottom) end = i;
+            offset += h;
+        }
+        if (start < 0) { start = items.length; startOffset = offset; }
+        const visible = items.slice(start, Math.max(end + 1, start));
+
+        // 2. Unmount what left the window, mount what entered it (order preserved)
+        const wanted = new Set(visible);
+        chatList.mounted.forEach((node, item) => {
+            if (!wanted.has(item)) {
+                node.remove();
+                chatList.mounted.delete(item);
+            }
+        });
+        let cursor = chatList.windowEl.firstChild;
+        visible.forEach(item => {
+            let node = chatList.mounted.get(item);
+            if (!node) {
+                node = buildMessageNode(item);
+                chatList.mounted.set(item, node);
+            }
+            if (node !== cursor) chatList.windowEl.insertBefore(node, cursor);
+            else cursor = cursor.nextSibling;
+        });
 
-            msgDiv.appendChild(btn);
+        // 3. Measure mounted rows; growth above the viewport is compensated in scrollTop
+        let total = offset;
+        let rowOffset = startOffset;
+        let anchorShift = 0;
+        visible.forEach(item => {
+            const h = chatList.mounted.get(item).offsetHeight + CHAT_ROW_MARGIN;
+            if (h !== item.height) {
+                if (rowOffset + item.height <= viewTop) anchorShift += h - item.height;
+                total += h - item.height;
+                item.height = h;
+            }
+            rowOffset += item.height;
+        });
 
-            // OPTIONAL: Auto-speak immediately - will set for Blind people
-            // speakText(text);
+        chatList.topSpacer.style.height = startOffset + "px";
+        chatList.bottomSpacer.style.height = (total - rowOffset) + "px";
 
+        if (chatList.stickToBottom) {
+            const target = box.scrollHeight - box.clientHeight;
+            if (Math.abs(box.scrollTop - target) < 1 && anchorShift === 0 && pass > 0) break;
+            box.scrollTop = target;
         } else {
-            msgDiv.innerText = text;
+            if (anchorShift !== 0) box.scrollTop += anchorShift;
+            break;
         }
     }
+    chatList.stickToBottom = false;
+
+    // 4. Near the top? Pull the previous page of history
+    if (chatList.hasMore && !chatList.loadingOlder && chatViewTop() < CHAT_BUFFER_PX) {
+        loadOlderHistory();
+    }
+}
+
+function historyToItem(msg) {
+    return createChatItem(msg.text, msg.is_user ? 'user' : 'bot', { id: msg.id });
+}
 
-    chatBox.appendChild(msgDiv);
+async function loadOlderHistory() {
+    const oldest = chatList.items.find(item => item.id !== null);
+    if (!oldest) {
+        chatList.hasMore = false;
+        return;
+    }
+
+    chatList.loadingOlder = true;
+    try {
+        const res = await fetch(`/api/chat/history?course_id=${getCourseId()}&before_id=${oldest.id}`);
+        const data = await res.json();
+        const older = data.messages.map(historyToItem);
+
+        chatList.items = older.concat(chatList.items);
+        chatList.hasMore = data.has_more;
+        document.getElementById('chatWelcome').hidden = chatList.hasMore;
+
+        // The new rows sit above the current view: grow the spacer and shift by the same amount
+        const shift = older.length * CHAT_ESTIMATED_HEIGHT;
+        const currentTop = parseFloat(chatList.topSpacer.style.height) || 0;
+        chatList.topSpacer.style.height = (currentTop + shift) + "px";
+        chatList.box.scrollTop += shift;
+    } catch (e) {
+        console.error("History Load Error", e);
+    } finally {
+        chatList.loadingOlder = false;
+        scheduleChatRender();
+    }
+}
+
+function initChatList() {
+    chatList.box = document.getElementById('chatBox');
+    if (!chatList.box) return;
+    chatList.topSpacer = document.getElementById('chatTopSpacer');
+    chatList.windowEl = document.getElementById('chatWindow');
+    chatList.bottomSpacer = document.getElementById('chatBottomSpacer');
+
+    const initial = JSON.parse(document.getElementById('initialHistory').textContent);
+    chatList.items = initial.messages.map(historyToItem);
+    chatList.hasMore = initial.has_more;
+
+    chatList.box.addEventListener('scroll', scheduleChatRender, { passive: true });
+    window.addEventListener('resize', scheduleChatRender);
+    scrollToBottom();
+}
+
+// Appends a message to the chat and returns its item (pass it to removeMessage later)
+function appendMessage(text, sender, extra = {}) {
+    const item = createChatItem(text, sender, extra);
+    chatList.items.push(item);
     scrollToBottom();
+    return item;
+}
+
+function appendLoadingMessage(html, extra = {}) {
+    return appendMessage(null, 'bot', Object.assign({ rawHtml: html }, extra));
+}
+
+function removeMessages(predicate) {
+    chatList.items = chatList.items.filter(item => {
+        if (!predicate(item)) return true;
+        const node = chatList.mounted.get(item);
+        if (node) {
+            node.remove();
+            chatList.mounted.delete(item);
+        }
+        return false;
+    });
+    scheduleChatRender();
 }
+
+function removeMessage(item) {
+    removeMessages(other => other === item);
+}
+
 function speakText(text) {
     window.speechSynthesis.cancel();
 
@@ -127,36 +341,58 @@ function speakText(text) {
 
     window.speechSynthesis.speak(utterance);
 }
-// This function fixes the history when you reload the page
-window.onload = function() {
-    // Scroll to bottom
-    scrollToBottom();
+document.addEventListener('DOMContentLoaded', initChatList);
 
-    // Parse Markdown for existing history messages
-    const botMessages = document.querySelectorAll('.message.bot');
+// --- SPECULATIVE RETRIEVAL (Prefetch while typing) ---
+// The draft is sent to /api/retrieve/preview after a pause in typing, so the retrieval
+// step is usually done by the time the message is sent. Hit rate: GET /api/retrieve/stats
+const PREVIEW_DEBOUNCE_MS = 500;
 
-    botMessages.forEach(msg => {
-        if (msg.classList.contains('quiz-bubble') || msg.querySelector('button')) {
-            return; // Skip quizzes
-        }
+let previewState = { timer: null, controller: null, promise: null, query: "" };
+
+function getSelectedNoteIds() {
+    const checkboxes = document.querySelectorAll('.note-checkbox:checked');
+    return Array.from(checkboxes).map(cb => parseInt(cb.value));
+}
+
+function normalizeQuery(text) {
+    // Must match normalize_query in main.py
+    return text.toLowerCase().split(/\s+/).filter(Boolean).join(' ');
+}
+
+function cancelPreview() {
+    clearTimeout(previewState.timer);
+    if (previewState.controller) previewState.controller.abort();
+    previewState = { timer: null, controller: null, promise: null, query: "" };
+}
+
+function schedulePreview() {
+    const courseId = getCourseId();
+    const draft = document.getElementById("userInput").value;
+    if (!courseId) return;
+
+    // A new keystroke supersedes the pending (or in-flight) preview
+    cancelPreview();
+    previewState.timer = setTimeout(() => {
+        const controller = new AbortController();
+        previewState.controller = controller;
+        previewState.query = normalizeQuery(draft);
+        previewState.promise = fetch('/api/retrieve/preview', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                message: draft,
+                course_id: courseId,
+                note_ids: getSelectedNoteIds()
+            }),
+            signal: controller.signal
+        }).catch(() => {}); // Aborted or offline: the chat request simply retrieves itself
+    }, PREVIEW_DEBOUNCE_MS);
+}
+
+const userInputEl = document.getElementById("userInput");
+if (userInputEl) userInputEl.addEventListener('input', schedulePreview);
 
-        // If it contains the raw QUIZ tag, render it as a quiz
-        if (msg.innerText.includes("[QUIZ_DATA]")) {
-            const rawText = msg.innerText;
-            msg.innerText = ""; // Clear raw text
-            try {
-                const quizJson = JSON.parse(rawText.replace("[QUIZ_DATA]", "").trim());
-                renderInteractiveQuiz(quizJson, msg);
-            } catch(e) { console.error("History Parse Error", e); }
-        }
-        // Otherwise, it's a text message -> Convert Markdown to HTML
-        else {
-            if (!msg.innerHTML.includes("<p>")) {
-                msg.innerHTML = marked.parse(msg.innerText);
-            }
-        }
-    });
-};
 async function sendMessage() {
     const courseId = getCourseId();
     if (!courseId) return;
@@ -166,18 +402,22 @@ async function sendMessage() {
     if (!message) return;
 
     // Get checked notes
-    const checkboxes = document.querySelectorAll('.note-checkbox:checked');
-    const selectedIds = Array.from(checkboxes).map(cb => parseInt(cb.value));
+    const selectedIds = getSelectedNoteIds();
+
+    // If the preview for exactly this message is still running, let it finish: the
+    // server then reuses its result instead of retrieving a second time
+    const pendingPreview = previewState.query === normalizeQuery(message) ? previewState.promise : null;
+    if (!pendingPreview) cancelPreview();
 
     appendMessage(message, 'user');
     input.value = "";
 
-    const loadingId = "loading-" + Date.now();
-    const chatBox = document.getElementById("chatBox");
-    chatBox.innerHTML += `<div class="message bot" id="${loadingId}">Thinking...</div>`;
-    scrollToBottom();
+    const loading = appendLoadingMessage("Thinking...");
 
     try {
+        if (pendingPreview) await pendingPreview;
+        previewState = { timer: null, controller: null, promise: null, query: "" };
+
         let response = await fetch('/api/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -189,7 +429,7 @@ async function sendMessage() {
         });
         let data = await response.json();
 
-        document.getElementById(loadingId).remove();
+        removeMessage(loading);
 
         if (data.is_quiz) {
             appendMessage(data.response, 'bot');
@@ -198,7 +438,7 @@ async function sendMessage() {
         }
 
     } catch (error) {
-        if(document.getElementById(loadingId)) document.getElementById(loadingId).remove();
+        removeMessage(loading);
         appendMessage("⚠️ Error: Could not reach server.", 'bot');
     }
 }
@@ -329,10 +569,7 @@ async function fetchNextQuestion() {
     }
     quizState.current++;
 
-    const loadingId = 'loading-' + Date.now();
-    const chatBox = document.getElementById("chatBox");
-    chatBox.innerHTML += `<div class="message bot quiz-bubble" id="${loadingId}">Generating Q${quizState.current}...</div>`;
-    scrollToBottom();
+    const loading = appendLoadingMessage(`Generating Q${quizState.current}...`, { quizBubble: true });
 
     try {
         const response = await fetch('/api/chat', {
@@ -346,26 +583,23 @@ async function fetchNextQuestion() {
             })
         });
         const data = await response.json();
-        document.getElementById(loadingId).remove();
+        removeMessage(loading);
 
         if (data.is_quiz) renderQuizForSession(data.response);
 
-    } catch (e) { console.error(e); }
+    } catch (e) {
+        console.error(e);
+        removeMessage(loading);
+    }
 }
 
 function renderQuizForSession(quizData) {
-    const chatBox = document.getElementById('chatBox');
-    const msgDiv = document.createElement('div');
-    msgDiv.classList.add('message', 'bot', 'quiz-bubble');
-    renderInteractiveQuiz(quizData, msgDiv);
-    chatBox.appendChild(msgDiv);
-    scrollToBottom();
+    appendMessage(quizData, 'bot', { quizBubble: true });
 }
 
 function finishQuizSession() {
     quizState.active = false;
-    const bubbles = document.querySelectorAll('.quiz-bubble');
-    bubbles.forEach(el => el.remove());
+    removeMessages(item => item.quizBubble);
     appendMessage("✅ Quiz session finished. Check 'Review Quizzes' to see results.", 'bot');
     alert("🎉 Quiz Complete! Results saved to history.");
 }
@@ -377,15 +611,11 @@ async function fetchSummary() {
     const topic = topicInput ? topicInput.value.trim() : "";
 
     // User Feedback in Chat
-    const loadingId = "loading-" + Date.now();
-    const chatBox = document.getElementById("chatBox");
-
     let loadingText = topic
         ? `Generating summary for "<b>${topic}</b>"...`
         : "Generating full course summary...";
 
-    chatBox.innerHTML += `<div class="message bot" id="${loadingId}">${loadingText} <div class="spinner"></div></div>`;
-    scrollToBottom();
+    const loading = appendLoadingMessage(`${loadingText} <div class="spinner"></div>`);
 
     try {
         const res = await fetch('/api/summary', {
@@ -396,14 +626,14 @@ async function fetchSummary() {
         const data = await res.json();
 
         // Remove Loader
-        document.getElementById(loadingId).remove();
+        removeMessage(loading);
 
         // Render in Chat (appendMessage will handle the Markdown)
         appendMessage(data.summary, 'bot');
 
     } catch (e) {
         console.error(e);
-        if(document.getElementById(loadingId)) document.getElementById(loadingId).remove();
+        removeMessage(loading);
         appendMessage("⚠️ Error generating summary. Please try again.", 'bot');
     }
 }
@@ -495,7 +725,7 @@ function renderFileItem(id, name, container) {
 async function deleteNote(id) {
     if(!confirm("Remove this note?")) return;
     try {
-        const response = await fetch(`/api/note/${id}`, { method: 'DELETE' });
+        const response = await fetch(`/api/note/${id}?course_id=${getCourseId()}`, { method: 'DELETE' });
         if (response.ok) document.getElementById(`note-${id}`).remove();
     } catch (e) { console.error(e); }
 }
@@ -504,7 +734,7 @@ async function renameNote(id, oldName) {
     const newName = prompt("Enter new filename:", oldName);
     if (!newName || newName === oldName) return;
     try {
-        const response = await fetch(`/api/note/${id}`, {
+        const response = await fetch(`/api/note/${id}?course_id=${getCourseId()}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ new_name: newName })
@@ -521,41 +751,6 @@ async function renameNote(id, oldName) {
     } catch (e) { console.error(e); }
 }
 
-window.onload = scrollToBottom;
-
-
-window.onload = function() {
-    scrollToBottom();
-
-    const botMessages = document.querySelectorAll('.message.bot');
-
-    botMessages.forEach(msg => {
-        if (msg.querySelector('button') || msg.querySelector('.spinner')) {
-            return;
-        }
-
-        const rawText = msg.innerText;
-        if (rawText.includes("[QUIZ_DATA]")) {
-            msg.innerText = "";
-            try {
-                const jsonString = rawText.replace("[QUIZ_DATA]", "").trim();
-                const quizJson = JSON.parse(jsonString);
-                renderInteractiveQuiz(quizJson, msg);
-            } catch (e) {
-                console.error("Error restoring quiz:", e);
-                msg.innerText = "⚠️ Error loading quiz.";
-            }
-        }
-
-        else {
-            if (!msg.innerHTML.includes("<p>")) {
-                msg.innerHTML = marked.parse(rawText);
-            }
-        }
-    });
-};
-
-
 /* --- AUDIO FEATURES ->Still needs some adjustments  --- */
 
 //  SPEECH TO TEXT (User Voice)